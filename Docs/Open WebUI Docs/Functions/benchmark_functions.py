@@ -0,0 +1,687 @@
+"""
+title: OpenWebUI Functions Benchmark
+author: Wes Caldwell
+email: musicheardworldwide@gmail.com
+author_url: https://github.com/musicheardworldwide
+version: 1.0.0
+license: MIT
+description: Load harness that drives the Pipe, Filter and Action functions against a local mock LLM upstream and reports throughput, latency percentiles and memory.
+requirements:
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import logging
+import threading
+import tracemalloc
+import concurrent.futures
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+
+# The functions are single files living next to this harness
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Configure Logging
+logger = logging.getLogger(__name__)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+
+# Mock LLM Upstream
+class MockUpstreamHandler(BaseHTTPRequestHandler):
+    """
+    Serves the Pipe's streaming and non-streaming endpoints and an OpenAI-style
+    chat completions endpoint for the Action.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Streamed events are tiny writes; do not let Nagle batch them
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def do_HEAD(self):
+        # Image URL size checks
+        self.send_response(200)
+        self.send_header("Content-Length", "1024")
+        self.end_headers()
+
+    def do_POST(self):
+        server: MockUpstream = self.server.upstream
+        request = json.loads(self.read_body() or b"{}")
+
+        if server.error_rate and random.random() < server.error_rate:
+            self.send_json(503, {"error": "injected upstream failure"})
+            return
+        if server.latency:
+            time.sleep(server.latency)
+
+        text = server.completion()
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(
+                200,
+                {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "mock"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": f"<html><body><p>{text}</p></body></html>",
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                },
+            )
+        elif request.get("stream"):
+            self.send_stream(server)
+        else:
+            self.send_json(200, {"response": text})
+
+    def read_body(self) -> bytes:
+        """
+        Reads a Content-Length or chunked request body.
+
+        Returns:
+            bytes: The raw request body.
+        """
+        if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        body = bytearray()
+        while True:
+            size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+            if size == 0:
+                self.rfile.readline()
+                return bytes(body)
+            body += self.rfile.read(size)
+            self.rfile.readline()
+
+    def send_json(self, status: int, data: Dict):
+        encoded = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def send_stream(self, server: "MockUpstream"):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        interval = 1.0 / server.token_rate if server.token_rate else 0.0
+        for token in server.tokens():
+            event = json.dumps(
+                {
+                    "type": "content_block_delta",
+                    "index": 0,
+                    "delta": {"type": "text_delta", "text": token},
+                }
+            )
+            self.write_chunk(f"event: content_block_delta\ndata: {event}\n\n".encode())
+            if interval:
+                time.sleep(interval)
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+class MockHTTPServer(ThreadingHTTPServer):
+    """
+    Threaded server sized for benchmark concurrency.
+    """
+
+    daemon_threads = True
+    # The default backlog of 5 drops SYNs under load and adds 1s retransmit stalls
+    request_queue_size = 1024
+
+    def handle_error(self, request: Any, client_address: Any):
+        # Clients closing a finished stream early is expected, not a server fault
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockUpstream:
+    """
+    Local mock LLM server with configurable token rate, latency and error injection.
+
+    Runs a threaded HTTP server on an ephemeral port until stopped; use it as a
+    context manager.
+    """
+
+    WORDS = ("the", "model", "streams", "a", "damn", "fine", "answer", "about", "latency")
+
+    def __init__(
+        self,
+        token_rate: float = 0.0,
+        completion_tokens: int = 64,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+    ):
+        """
+        Args:
+            token_rate (float): Streamed tokens per second per request (0 sends as fast as possible).
+            completion_tokens (int): Tokens in each completion.
+            latency (float): Seconds to wait before answering, modelling time to first token.
+            error_rate (float): Fraction of requests answered with a 503.
+        """
+        self.token_rate = token_rate
+        self.completion_tokens = completion_tokens
+        self.latency = latency
+        self.error_rate = error_rate
+        self._server: Optional[MockHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def tokens(self) -> List[str]:
+        """
+        Builds the tokens of one completion.
+
+        Returns:
+            List[str]: Words with their leading space.
+        """
+        return [
+            f" {self.WORDS[index % len(self.WORDS)]}"
+            for index in range(self.completion_tokens)
+        ]
+
+    def completion(self) -> str:
+        return "".join(self.tokens()).strip()
+
+    def start(self) -> "MockUpstream":
+        self._server = MockHTTPServer(("127.0.0.1", 0), MockUpstreamHandler)
+        self._server.upstream = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "MockUpstream":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any):
+        self.stop()
+
+
+# Measurement
+def percentile(values: List[float], q: float) -> float:
+    """
+    Nearest-rank percentile.
+
+    Args:
+        values (List[float]): Samples, in any order.
+        q (float): Percentile between 0 and 100.
+
+    Returns:
+        float: The percentile, 0.0 when there are no samples.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(
+    name: str,
+    latencies: List[float],
+    errors: int,
+    elapsed: float,
+    first_chunks: Optional[List[float]] = None,
+    peak_bytes: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Builds the report of one benchmark run.
+
+    Args:
+        name (str): The benchmarked target.
+        latencies (List[float]): Seconds per completed request.
+        errors (int): Requests that failed or returned a structured error.
+        elapsed (float): Wall-clock seconds of the whole run.
+        first_chunks (Optional[List[float]]): Seconds to the first streamed chunk.
+        peak_bytes (Optional[int]): Peak traced memory, when tracemalloc was enabled.
+
+    Returns:
+        Dict[str, Any]: Throughput, latency percentiles in milliseconds and memory.
+    """
+    report = {
+        "target": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+    if first_chunks:
+        report["ttfc_p50_ms"] = round(percentile(first_chunks, 50) * 1000, 3)
+        report["ttfc_p99_ms"] = round(percentile(first_chunks, 99) * 1000, 3)
+    if peak_bytes is not None:
+        report["peak_traced_mb"] = round(peak_bytes / (1024 * 1024), 2)
+    try:
+        import resource
+
+        # ru_maxrss is reported in kilobytes on Linux
+        report["max_rss_mb"] = round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2
+        )
+    except ImportError:  # Not available on Windows
+        pass
+    return report
+
+
+def is_error(result: Any) -> bool:
+    return isinstance(result, dict) and result.get("error") is True
+
+
+async def run_load(
+    name: str,
+    call: Callable[[int], Awaitable[Any]],
+    requests: int,
+    concurrency: int,
+    trace_memory: bool = False,
+) -> Dict[str, Any]:
+    """
+    Runs a request function at a fixed concurrency and measures it.
+
+    Args:
+        name (str): The benchmarked target.
+        call (Callable[[int], Awaitable[Any]]): Performs request number i; returns its
+            result, or a (result, seconds to first chunk) tuple for streams.
+        requests (int): Total number of requests.
+        concurrency (int): Requests in flight at once.
+        trace_memory (bool): Track peak Python allocations with tracemalloc (slower).
+
+    Returns:
+        Dict[str, Any]: The run report, see summarize.
+    """
+    latencies: List[float] = []
+    first_chunks: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for index in counter:
+            started = time.perf_counter()
+            try:
+                result = await call(index)
+            except Exception as e:
+                logger.debug(f"{name} request {index} raised: {e}")
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            if isinstance(result, tuple):
+                result, first_chunk = result
+                if first_chunk is not None:
+                    first_chunks.append(first_chunk)
+            if is_error(result):
+                errors += 1
+
+    loop = asyncio.get_running_loop()
+    # Sync functions run on threads; size the pool so concurrency is not capped by it
+    loop.set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    )
+
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    peak_bytes = None
+    if trace_memory:
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return summarize(name, latencies, errors, elapsed, first_chunks, peak_bytes)
+
+
+# Sample Requests
+def chat_body(index: int, turns: int, stream: bool, unique: bool = True) -> Dict:
+    """
+    Builds an Open WebUI chat request with some history.
+
+    Args:
+        index (int): Request number, mixed into the last message when unique.
+        turns (int): History messages before the last user message.
+        stream (bool): Whether a streamed response is requested.
+        unique (bool): Make every request distinct so it is not coalesced or cached.
+
+    Returns:
+        Dict: The request body.
+    """
+    history = [
+        {
+            "role": "user" if turn % 2 == 0 else "assistant",
+            "content": f"Turn {turn}: what the hell happened to the p99 latency after the deploy?",
+        }
+        for turn in range(turns)
+    ]
+    question = "Summarize the damn incident report"
+    if unique:
+        question += f" #{index}"
+    return {
+        "model": "mock-model",
+        "messages": history + [{"role": "user", "content": question}],
+        "stream": stream,
+    }
+
+
+# Function Drivers
+def pipe_runner(url: str, args: argparse.Namespace) -> Callable[[int], Awaitable[Any]]:
+    from pipe_function import Pipe
+
+    pipe = Pipe()
+    pipe.config.API_ENDPOINT = f"{url}/process"
+    pipe.config.API_KEY = "benchmark"
+    pipe.config.COALESCE_REQUESTS = args.coalesce
+    pipe.config.RESPONSE_CACHE_ENABLED = False
+    pipe.config.LIMITER_INITIAL = max(pipe.config.LIMITER_INITIAL, args.concurrency)
+    pipe.config.LIMITER_MAX_QUEUE = max(pipe.config.LIMITER_MAX_QUEUE, args.concurrency)
+    pipe.config.POOL_MAXSIZE = max(pipe.config.POOL_MAXSIZE, args.concurrency)
+
+    def body(index: int) -> Dict:
+        return chat_body(index, args.turns, args.stream, unique=not args.coalesce)
+
+    if args.use_async:
+
+        async def call(index: int) -> Any:
+            started = time.perf_counter()
+            result = await pipe.pipe(body(index))
+            if not hasattr(result, "__aiter__"):
+                return result, None
+            first_chunk = None
+            async for chunk in result:
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - started
+                if is_error(chunk):
+                    return chunk, first_chunk
+            return "", first_chunk
+
+        return call
+
+    def consume(index: int) -> Any:
+        started = time.perf_counter()
+        result = pipe.sync_pipe(body(index))
+        if isinstance(result, (str, dict)):
+            return result, None
+        first_chunk = None
+        for chunk in result:
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - started
+            if is_error(chunk):
+                return chunk, first_chunk
+        return "", first_chunk
+
+    async def call(index: int) -> Any:
+        return await asyncio.to_thread(consume, index)
+
+    return call
+
+
+def filter_runner(url: str, args: argparse.Namespace) -> Callable[[int], Awaitable[Any]]:
+    from filter_function import Filter
+
+    filter_obj = Filter()
+    filter_obj.config.ENFORCE_JSON_OUTPUT = args.enforce_json
+    completion = MockUpstream(completion_tokens=args.tokens).completion()
+
+    def roundtrip(index: int) -> Any:
+        request = filter_obj.inlet(chat_body(index, args.turns, args.stream))
+        if is_error(request):
+            return request
+        response = {
+            "messages": request["messages"] + [{"role": "assistant", "content": completion}]
+        }
+        return filter_obj.outlet(response)
+
+    async def call(index: int) -> Any:
+        return await asyncio.to_thread(roundtrip, index)
+
+    return call
+
+
+def action_runner(url: str, args: argparse.Namespace) -> Callable[[int], Awaitable[Any]]:
+    from action_function import Action
+
+    action = Action()
+    action.valves.OPENAI_KEY = "benchmark"
+    action.valves.OPENAI_URL = f"{url}/v1"
+    # Keep Open WebUI's file store out of the measurement
+    action.create_or_get_file = lambda user_id, html_content: str(uuid.uuid4())
+
+    async def emit(event: Dict):
+        pass
+
+    async def call(index: int) -> Any:
+        body = chat_body(index, args.turns, stream=False)
+        return await action.action(
+            body, __user__={"id": "benchmark"}, __event_emitter__=emit
+        )
+
+    return call
+
+
+RUNNERS = {
+    "pipe": pipe_runner,
+    "filter": filter_runner,
+    "action": action_runner,
+}
+
+
+async def run_benchmarks(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """
+    Starts the mock upstream and benchmarks every requested target.
+
+    Args:
+        args (argparse.Namespace): Parsed command line options.
+
+    Returns:
+        List[Dict[str, Any]]: One report per target.
+    """
+    targets = list(RUNNERS) if args.target == "all" else [args.target]
+    reports = []
+    with MockUpstream(
+        token_rate=args.token_rate,
+        completion_tokens=args.tokens,
+        latency=args.latency,
+        error_rate=args.error_rate,
+    ) as upstream:
+        for target in targets:
+            call = RUNNERS[target](upstream.url, args)
+            if not args.verbose:
+                # Importing a function resets its logger to INFO
+                logging.getLogger(f"{target}_function").setLevel(logging.WARNING)
+            if args.warmup:
+                await run_load(target, call, args.warmup, min(args.concurrency, args.warmup))
+            reports.append(
+                await run_load(
+                    target, call, args.requests, args.concurrency, args.trace_memory
+                )
+            )
+    return reports
+
+
+# Serializer Micro-benchmark
+def sample_chat_payload(
+    turns: int = 200, images: int = 4, image_bytes: int = 1024 * 1024
+) -> Dict:
+    """
+    Builds an upstream payload shaped like a long multimodal conversation.
+
+    Args:
+        turns (int): Number of history messages.
+        images (int): Inline base64 images attached to the last message.
+        image_bytes (int): Decoded size of each image.
+
+    Returns:
+        Dict: A payload whose image data are plain strings.
+    """
+    text = (
+        "Here is the revised plan — step one: profile the hot path, "
+        "step two: remove the copies, step three: measure again. "
+    ) * 5
+    messages = [
+        {"role": "user" if turn % 2 == 0 else "assistant", "content": f"{turn}: {text}"}
+        for turn in range(turns)
+    ]
+    image = "A" * (image_bytes * 4 // 3)
+    messages.append(
+        {
+            "role": "user",
+            "content": [{"type": "text", "text": "Compare these screenshots."}]
+            + [
+                {
+                    "type": "image",
+                    "source": {"type": "base64", "media_type": "image/png", "data": image},
+                }
+                for _ in range(images)
+            ],
+        }
+    )
+    return {
+        "model": "example-model",
+        "messages": messages,
+        "max_tokens": 4096,
+        "temperature": 0.8,
+        "stream": True,
+    }
+
+
+def benchmark_serializers(
+    rounds: int = 10, turns: int = 200, images: int = 4
+) -> Dict[str, Dict[str, float]]:
+    """
+    Times every installed JSON backend on realistic chat payloads.
+
+    Measures encoding the whole payload, producing the streamed request body
+    (images referenced through ImageBuffer), decoding a non-streaming response and
+    decoding a single escaped SSE delta. The best of all rounds is reported.
+
+    Args:
+        rounds (int): Repetitions per measurement.
+        turns (int): History messages in the sample payload.
+        images (int): Inline images in the sample payload.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Milliseconds per operation for each backend.
+    """
+    from pipe_function import (
+        JSON_SERIALIZERS,
+        ImageBuffer,
+        SSEDeltaDecoder,
+        StreamingJSONBody,
+        get_serializer,
+    )
+
+    payload = sample_chat_payload(turns, images)
+    buffered = json.loads(json.dumps(payload))
+    for part in buffered["messages"][-1]["content"]:
+        if part["type"] == "image":
+            part["source"]["data"] = ImageBuffer(part["source"]["data"], 0)
+    response = json.dumps({"response": payload["messages"][-2]["content"] * 20})
+    event = json.dumps({"type": "content_block_delta", "delta": {"text": 'a "quoted"\n line'}})
+
+    def best(function, repeat: int = 1) -> float:
+        timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                function()
+            timings.append((time.perf_counter() - started) / repeat)
+        return min(timings) * 1000
+
+    results = {}
+    for name in JSON_SERIALIZERS:
+        serializer = get_serializer(name)
+        encoded = serializer.dumps(payload)
+        results[name] = {
+            "encode_ms": best(lambda: serializer.dumps(payload)),
+            "stream_body_ms": best(
+                lambda: b"".join(StreamingJSONBody(buffered, serializer=serializer))
+            ),
+            "decode_ms": best(lambda: serializer.loads(encoded)),
+            "response_ms": best(lambda: serializer.loads(response), repeat=10),
+            "sse_delta_ms": best(
+                lambda: SSEDeltaDecoder(serializer).feed(
+                    b"data: " + event.encode() + b"\n"
+                ),
+                repeat=1000,
+            ),
+        }
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Open WebUI functions against a mock upstream"
+    )
+    parser.add_argument("target", nargs="?", default="all", choices=["all", *RUNNERS])
+    parser.add_argument("-n", "--requests", type=int, default=200, help="Requests per target")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests per target")
+    parser.add_argument("--stream", action="store_true", help="Request streamed responses")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Await Pipe.pipe instead of running Pipe.sync_pipe in threads")
+    parser.add_argument("--coalesce", action="store_true", help="Send identical Pipe requests and let them coalesce")
+    parser.add_argument("--turns", type=int, default=20, help="History messages per request")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per completion")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Streamed tokens per second (0 is unthrottled)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Upstream seconds before answering")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of upstream 503s")
+    parser.add_argument("--enforce-json", action="store_true", help="Enable the Filter's ENFORCE_JSON_OUTPUT")
+    parser.add_argument("--trace-memory", action="store_true", help="Report peak allocations via tracemalloc")
+    parser.add_argument("--json", action="store_true", help="Print reports as JSON lines")
+    parser.add_argument("--verbose", action="store_true", help="Keep the functions' per-request logging")
+    parser.add_argument("--bench-json", action="store_true", help="Time the Pipe's JSON backends instead of running the load benchmark")
+    return parser.parse_args(argv)
+
+
+# Example Usage
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.verbose:
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if args.bench_json:
+        for name, timings in benchmark_serializers().items():
+            if args.json:
+                print(json.dumps({"backend": name, **timings}))
+            else:
+                print(name, " ".join(f"{key}={value:.4f}" for key, value in timings.items()))
+        sys.exit(0)
+
+    for report in asyncio.run(run_benchmarks(args)):
+        if args.json:
+            print(json.dumps(report))
+        else:
+            print(" ".join(f"{key}={value}" for key, value in report.items()))
@@ -9,10 +9,22 @@ description: A structured Open WebUI filter with advanced text sanitization, JSO
 requirements:
 """
 
+import os
+import re
 import json
+import time
+import copy
+import uuid
+import bisect
+import hashlib
 import logging
+import itertools
+import threading
 import traceback
-from typing import Optional, Dict, Any
+import multiprocessing
+import concurrent.futures
+from collections import Counter, OrderedDict, deque
+from typing import Optional, Dict, Any, List, Iterable, Union, IO, Tuple
 from pydantic import BaseModel, Field
 from fastapi import Request
 
@@ -53,12 +65,386 @@ def handle_error(exception: Exception, function_name: str, inputs: dict) -> dict
     }
 
 
+# Word List Files
+def word_list_files(path: str) -> List[str]:
+    """
+    Lists the word list files at a path.
+
+    Args:
+        path (str): A word list file, or a directory searched for *.txt files (e.g. one per locale).
+
+    Returns:
+        List[str]: File paths in a stable order.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    files = []
+    for root, directories, names in os.walk(path):
+        directories.sort()
+        files.extend(
+            os.path.join(root, name) for name in sorted(names) if name.endswith(".txt")
+        )
+    return files
+
+
+def word_list_signature(path: str) -> tuple:
+    """
+    Summarises the word list files so changes can be detected with stat calls only.
+
+    Args:
+        path (str): A word list file or directory.
+
+    Returns:
+        tuple: (file, mtime, size) for every file.
+    """
+    signature = []
+    for file in word_list_files(path):
+        stat = os.stat(file)
+        signature.append((file, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def read_word_list(path: str) -> List[str]:
+    """
+    Reads the words of a word list file or directory.
+
+    One word or phrase per line; blank lines and lines starting with # are skipped.
+
+    Args:
+        path (str): A word list file or directory.
+
+    Returns:
+        List[str]: The words.
+    """
+    words = []
+    for file in word_list_files(path):
+        with open(file, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    words.append(line)
+    return words
+
+
+# Word Matching
+class WordMatcher:
+    """
+    Matches a whole word list in a single pass over the text.
+
+    The words are folded into a trie and compiled into one regular expression, so
+    shared prefixes are tested once and the scan stays linear in the text length
+    even for tens of thousands of words. Matches only stand on word boundaries and
+    ignore case, so words embedded in longer words are left alone. Each word is a
+    rule identified as "<name>:<word>".
+    """
+
+    def __init__(
+        self,
+        words: Iterable[str],
+        replacement: str = "***",
+        name: str = "word",
+    ):
+        self.words = sorted({word.strip().lower() for word in words if word.strip()})
+        self.replacement = replacement
+        self.name = name
+        self.max_length = max(map(len, self.words), default=0)
+        self.fingerprint = hashlib.sha256(
+            "\n".join(self.words).encode("utf-8")
+        ).hexdigest()
+        self.pattern = (
+            re.compile(rf"(?<!\w){self.trie_pattern(self.words)}(?!\w)", re.IGNORECASE)
+            if self.words
+            else None
+        )
+
+    @staticmethod
+    def trie_pattern(words: Iterable[str]) -> str:
+        """
+        Builds a regular expression source matching exactly the given words.
+
+        Args:
+            words (Iterable[str]): Words to match.
+
+        Returns:
+            str: A non-capturing alternation shaped like the words' prefix trie.
+        """
+        trie: Dict[str, Dict] = {}
+        for word in words:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[""] = {}
+
+        def build(node: Dict[str, Dict]) -> str:
+            ends = "" in node
+            branches = [
+                re.escape(char) + build(child) for char, child in node.items() if char
+            ]
+            if not branches:
+                return ""
+            if len(branches) == 1:
+                body = branches[0]
+                if ends:
+                    return f"(?:{body})?" if len(body) > 1 else f"{body}?"
+                return body
+            if all(len(branch) == 1 for branch in branches):
+                body = f"[{''.join(branches)}]"
+            else:
+                body = f"(?:{'|'.join(branches)})"
+            return f"{body}?" if ends else body
+
+        return f"(?:{build(trie)})"
+
+    def sub(self, text: str) -> str:
+        """
+        Replaces every listed word in the text.
+
+        Args:
+            text (str): The text to censor.
+
+        Returns:
+            str: The text with each match replaced.
+        """
+        if self.pattern is None:
+            return text
+        return self.pattern.sub(self.replacement, text)
+
+    def scan(self, text: str) -> Tuple[str, List[Dict]]:
+        """
+        Replaces every listed word and reports the matches in the same pass.
+
+        Args:
+            text (str): The text to censor.
+
+        Returns:
+            Tuple[str, List[Dict]]: The censored text, and a rule id with start and
+            end offsets into the original text for every match.
+        """
+        if self.pattern is None:
+            return text, []
+
+        matches = []
+
+        def replace(match: "re.Match") -> str:
+            matches.append(
+                {
+                    "rule": self.rule_id(match.group()),
+                    "start": match.start(),
+                    "end": match.end(),
+                }
+            )
+            return self.replacement
+
+        return self.pattern.sub(replace, text), matches
+
+    def rule_id(self, matched: str) -> str:
+        return f"{self.name}:{matched.lower()}"
+
+    def is_prefix(self, text: str) -> bool:
+        """
+        Tells whether some listed word starts with the text.
+
+        Args:
+            text (str): Candidate word start.
+
+        Returns:
+            bool: True if more input could still complete a match.
+        """
+        text = text.lower()
+        index = bisect.bisect_left(self.words, text)
+        return index < len(self.words) and self.words[index].startswith(text)
+
+
+# Streaming Censorship
+class StreamCensor:
+    """
+    Censors a token stream incrementally.
+
+    Text is released as soon as no listed word can still match across the chunk
+    boundary. Only a tail that is itself the start of a listed word, beginning on
+    a word boundary, is held back, so ordinary tokens pass through without delay
+    and the output equals censoring the whole text at once.
+    """
+
+    def __init__(self, matcher: WordMatcher):
+        self.matcher = matcher
+        self.matches: List[Dict] = []
+        self._context = ""
+        self._pending = ""
+        # Characters of the stream released before _pending
+        self._released = 0
+
+    def feed(self, text: str) -> str:
+        """
+        Consumes a streamed delta.
+
+        Args:
+            text (str): The next chunk of the response.
+
+        Returns:
+            str: Censored text that is safe to emit now, possibly empty.
+        """
+        self._pending += text
+        if self.matcher.pattern is None:
+            return self._release(len(self._pending))
+        return self._release(self._hold_position())
+
+    def close(self) -> str:
+        """
+        Flushes the held-back tail at the end of the stream.
+
+        Returns:
+            str: Remaining censored text.
+        """
+        return self._release(len(self._pending))
+
+    def _hold_position(self) -> int:
+        pending = self._pending
+        first = max(0, len(pending) - self.matcher.max_length)
+        for position in range(first, len(pending)):
+            previous = pending[position - 1] if position else self._context
+            if previous and (previous.isalnum() or previous == "_"):
+                continue
+            if self.matcher.is_prefix(pending[position:]):
+                return position
+        return len(pending)
+
+    def _release(self, cut: int) -> str:
+        if cut == 0:
+            return ""
+
+        buffer = self._context + self._pending
+        offset = len(self._context)
+        pieces = []
+        written = offset
+        if self.matcher.pattern is not None:
+            for match in self.matcher.pattern.finditer(buffer, offset):
+                if match.start() >= offset + cut:
+                    break
+                pieces.append(buffer[written : match.start()])
+                pieces.append(self.matcher.replacement)
+                self.matches.append(
+                    {
+                        "rule": self.matcher.rule_id(match.group()),
+                        "start": self._released + match.start() - offset,
+                        "end": self._released + match.end() - offset,
+                    }
+                )
+                written = match.end()
+                # A match that started before the cut is complete, emit all of it
+                cut = max(cut, written - offset)
+        pieces.append(buffer[written : offset + cut])
+
+        self._context = buffer[offset + cut - 1]
+        self._pending = self._pending[cut:]
+        self._released += cut
+        return "".join(pieces)
+
+
+# Streaming JSON Encoding
+class JSONResponseEncoder:
+    """
+    Encodes a streamed response as a {"response": ...} JSON document, chunk by chunk.
+
+    The document opens with the first chunk and every chunk is escaped on its
+    own, so memory stays proportional to a chunk. The joined output is exactly
+    json.dumps({"response": text}) of the joined input.
+    """
+
+    PREFIX = '{"response": "'
+    SUFFIX = '"}'
+
+    def __init__(self):
+        self.started = False
+
+    def feed(self, text: str) -> str:
+        """
+        Encodes the next chunk.
+
+        Args:
+            text (str): A piece of the response.
+
+        Returns:
+            str: The escaped chunk, preceded by the document opening on the first call.
+        """
+        encoded = json.encoder.encode_basestring_ascii(text)[1:-1]
+        if not self.started:
+            self.started = True
+            return self.PREFIX + encoded
+        return encoded
+
+    def close(self) -> str:
+        """
+        Ends the document.
+
+        Returns:
+            str: The closing characters, plus the opening if nothing was fed.
+        """
+        return self.feed("") + self.SUFFIX if not self.started else self.SUFFIX
+
+
+class ResponseStream:
+    """
+    Applies the outlet transformations to one streamed response incrementally.
+    """
+
+    def __init__(
+        self,
+        censor: Optional[StreamCensor] = None,
+        encoder: Optional[JSONResponseEncoder] = None,
+    ):
+        self.censor = censor
+        self.encoder = encoder
+
+    def feed(self, text: str) -> str:
+        """
+        Transforms a streamed delta.
+
+        Args:
+            text (str): The next chunk of the response.
+
+        Returns:
+            str: Output that is ready to send, possibly empty.
+        """
+        if self.censor is not None:
+            text = self.censor.feed(text)
+        if self.encoder is not None:
+            text = self.encoder.feed(text)
+        return text
+
+    def close(self) -> str:
+        """
+        Flushes everything held back at the end of the stream.
+
+        Returns:
+            str: Remaining output.
+        """
+        text = self.censor.close() if self.censor is not None else ""
+        if self.encoder is not None:
+            text = self.encoder.feed(text) + self.encoder.close()
+        return text
+
+
 # Filter Definition
 class Filter:
     """
     OpenWebUI Filter for modifying input and output data dynamically.
     """
 
+    # Concurrent response streams tracked by the stream hook
+    MAX_STREAMS = 1024
+
+    # Valves a policy in POLICIES may override
+    POLICY_FIELDS = (
+        "ENABLE_TEXT_SANITIZATION",
+        "REMOVE_PROFANITY",
+        "ENFORCE_JSON_OUTPUT",
+        "SANITIZE_WORDS",
+        "PROFANITY_WORDS",
+        "SANITIZE_WORDS_PATH",
+        "PROFANITY_WORDS_PATH",
+    )
+
     class Config(BaseModel):
         ENABLE_TEXT_SANITIZATION: bool = Field(
             default=True, description="Enable text sanitization for user inputs."
@@ -69,14 +455,213 @@ class Filter:
         ENFORCE_JSON_OUTPUT: bool = Field(
             default=False, description="Ensure output responses conform to JSON format."
         )
+        SANITIZE_WORDS: List[str] = Field(
+            default=["badword"], description="Words masked in user inputs."
+        )
+        PROFANITY_WORDS: List[str] = Field(
+            default=["damn", "hell", "curseword1", "curseword2"],
+            description="Words censored in AI responses.",
+        )
+        SANITIZE_WORDS_PATH: str = Field(
+            default="",
+            description="Word list file or directory of *.txt lists added to SANITIZE_WORDS.",
+        )
+        PROFANITY_WORDS_PATH: str = Field(
+            default="",
+            description="Word list file or directory of *.txt lists added to PROFANITY_WORDS.",
+        )
+        WORD_LIST_CHECK_INTERVAL: float = Field(
+            default=5.0,
+            description="Seconds between checks of word list files for changes (0 checks every request).",
+        )
+        PROCESSED_CACHE_SIZE: int = Field(
+            default=4096,
+            description="Filtered messages remembered per chat so history is not filtered again (0 disables).",
+        )
+        POLICIES: Dict[str, Dict[str, Any]] = Field(
+            default={},
+            description="Named policies overriding the word list, sanitization and JSON valves.",
+        )
+        USER_POLICIES: Dict[str, str] = Field(
+            default={}, description="Policy name per user ID."
+        )
+        GROUP_POLICIES: Dict[str, str] = Field(
+            default={},
+            description="Policy name per group ID or role, used when the user has no policy of their own.",
+        )
+        MATCHER_CACHE_SIZE: int = Field(
+            default=64, description="Compiled word lists kept in memory across policies."
+        )
+        REPORT_MATCHES: bool = Field(
+            default=True,
+            description="Attach match spans and rule counts to body metadata under 'moderation'.",
+        )
 
     def __init__(self):
         self.config = self.Config()
+        self._lock = threading.Lock()
+        self._matchers: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._streams: "OrderedDict[tuple, ResponseStream]" = OrderedDict()
+        self._processed: "OrderedDict[str, None]" = OrderedDict()
+        self.rule_counts: Counter = Counter()
+        # Compile up front so the first request does not pay for it
+        self.word_matcher("SANITIZE_WORDS")
+        self.word_matcher("PROFANITY_WORDS")
+
+    def policy(self, __user__: Optional[Dict] = None) -> "Filter.Config":
+        """
+        Resolves the valves that apply to a user.
+
+        The user's own entry in USER_POLICIES wins, then the first of their groups
+        or role found in GROUP_POLICIES; everyone else gets the global valves. The
+        policy is a shallow copy, so valves it does not override share their word
+        lists with the global valves and reuse the same compiled matchers.
+
+        Args:
+            __user__ (Optional[Dict]): User metadata with "id", "role" and optional "groups".
+
+        Returns:
+            Filter.Config: The effective valves.
+        """
+        if not __user__ or not self.config.POLICIES:
+            return self.config
+
+        name = self.config.USER_POLICIES.get(str(__user__.get("id")))
+        if name is None:
+            groups = [
+                group.get("id") if isinstance(group, dict) else group
+                for group in __user__.get("groups") or []
+            ]
+            groups.append(__user__.get("role"))
+            name = next(
+                (
+                    self.config.GROUP_POLICIES[str(group)]
+                    for group in groups
+                    if str(group) in self.config.GROUP_POLICIES
+                ),
+                None,
+            )
+
+        overrides = self.config.POLICIES.get(name) if name else None
+        if not overrides:
+            return self.config
+        return self.config.model_copy(
+            update={
+                field: value
+                for field, value in overrides.items()
+                if field in self.POLICY_FIELDS
+            }
+        )
+
+    def word_matcher(
+        self, setting: str, config: Optional["Filter.Config"] = None
+    ) -> WordMatcher:
+        """
+        Returns the compiled matcher for a word list valve.
+
+        Matchers are cached per word list and file path with LRU eviction, so users
+        sharing a policy share its matchers. A matcher is rebuilt synchronously
+        when the valve or its _PATH valve is assigned a new value. Changed word
+        list files are picked up in the background: requests keep the current
+        matcher until the new one is compiled and swapped in.
+
+        Args:
+            setting (str): Name of the word list valve.
+            config (Optional[Filter.Config]): Policy to read the valve from, defaults to the global valves.
+
+        Returns:
+            WordMatcher: Matcher for the current word list.
+        """
+        config = config or self.config
+        words = getattr(config, setting)
+        path = getattr(config, f"{setting}_PATH")
+        key = (setting, id(words), path)
+        with self._lock:
+            entry = self._matchers.get(key)
+            if entry is not None:
+                self._matchers.move_to_end(key)
+        # The entry keeps its list alive, so a matching id means the same list
+        if entry is None or entry["words"] is not words:
+            entry = self.build_matcher(words, path, setting)
+            with self._lock:
+                self._matchers[key] = entry
+                while len(self._matchers) > max(self.config.MATCHER_CACHE_SIZE, 1):
+                    self._matchers.popitem(last=False)
+            return entry["matcher"]
+
+        now = time.monotonic()
+        if path and now - entry["checked"] >= self.config.WORD_LIST_CHECK_INTERVAL:
+            entry["checked"] = now
+            try:
+                changed = word_list_signature(path) != entry["files"]
+            except OSError as e:
+                logger.warning(f"Keeping the loaded word list, cannot read {path}: {e}")
+                changed = False
+            if changed and not entry["reloading"]:
+                entry["reloading"] = True
+                threading.Thread(
+                    target=self.reload_matcher,
+                    args=(key, entry),
+                    name=f"reload-{setting.lower()}",
+                    daemon=True,
+                ).start()
+        return entry["matcher"]
+
+    def build_matcher(self, words: List[str], path: str, setting: str) -> Dict:
+        """
+        Compiles a word list valve together with the words of its files.
+
+        Args:
+            words (List[str]): Inline words from the valve.
+            path (str): Word list file or directory, empty for none.
+            setting (str): Name of the word list valve, e.g. PROFANITY_WORDS for "profanity:" rules.
+
+        Returns:
+            Dict: Cache entry holding the matcher and the file signature it was built from.
+        """
+        files = word_list_signature(path) if path else ()
+        file_words = read_word_list(path) if path else []
+        matcher = WordMatcher(
+            [*words, *file_words],
+            name=setting.lower().replace("_words", ""),
+        )
+        if path:
+            logger.info(f"Compiled {len(matcher.words)} words with {path}")
+        return {
+            "words": words,
+            "path": path,
+            "files": files,
+            "checked": time.monotonic(),
+            "reloading": False,
+            "matcher": matcher,
+        }
+
+    def reload_matcher(self, key: tuple, entry: Dict):
+        """
+        Rebuilds a matcher after its word list files changed, then swaps it in.
+
+        Args:
+            key (tuple): The matcher cache key.
+            entry (Dict): The cache entry being replaced.
+        """
+        try:
+            fresh = self.build_matcher(entry["words"], entry["path"], key[0])
+        except Exception as e:
+            logger.error(f"Reloading {entry['path']} failed, keeping the old list: {e}")
+            entry["reloading"] = False
+            return
+        with self._lock:
+            # Skip the swap if the entry was evicted while compiling
+            if self._matchers.get(key) is entry:
+                self._matchers[key] = fresh
 
     def inlet(self, body: Dict, __user__: Optional[Dict] = None) -> Dict:
         """
         Modifies input data before it reaches the AI model.
 
+        The last message may be a string or a list of content parts; only text
+        parts are sanitized, in place, and image parts are never scanned.
+
         Args:
             body (Dict): The request payload.
             __user__ (Optional[Dict]): User metadata.
@@ -86,16 +671,27 @@ class Filter:
         """
         try:
             logger.info("Filtering input data...")
+            config = self.policy(__user__)
             messages = body.get("messages", [])
 
-            if messages:
-                user_message = messages[-1]["content"]
-
-                # Perform text sanitization
-                if self.config.ENABLE_TEXT_SANITIZATION:
-                    user_message = self.sanitize_text(user_message)
+            # Perform text sanitization
+            if messages and config.ENABLE_TEXT_SANITIZATION:
+                index = len(messages) - 1
+                user_message = messages[index]["content"]
+                matcher = self.word_matcher("SANITIZE_WORDS", config)
 
-                body["messages"][-1]["content"] = user_message
+                if isinstance(user_message, list):
+                    for part_index, part in enumerate(user_message):
+                        if (
+                            isinstance(part, dict)
+                            and part.get("type") == "text"
+                            and isinstance(part.get("text"), str)
+                        ):
+                            part["text"], matches = matcher.scan(part["text"])
+                            self.report_matches(body, matches, index, part_index)
+                elif isinstance(user_message, str):
+                    messages[index]["content"], matches = matcher.scan(user_message)
+                    self.report_matches(body, matches, index)
 
             return body
 
@@ -115,56 +711,337 @@ class Filter:
         """
         try:
             logger.info("Filtering output data...")
-            for message in body.get("messages", []):
-                message_content = message["content"]
+            return self.filter_output(body, self.policy(__user__))
 
-                # Remove explicit words if enabled
-                if self.config.REMOVE_PROFANITY:
-                    message_content = self.remove_profanity(message_content)
+        except Exception as e:
+            return handle_error(e, "outlet", body)
 
-                # Enforce JSON format if required
-                if self.config.ENFORCE_JSON_OUTPUT:
-                    message_content = self.ensure_json_format(message_content)
+    def filter_output(self, body: Dict, config: "Filter.Config") -> Dict:
+        """
+        Applies the outlet filters to the messages of a body in place.
 
-                message["content"] = message_content
+        Args:
+            body (Dict): The response payload.
+            config (Filter.Config): The user's policy.
 
+        Returns:
+            Dict: The same payload.
+        """
+        if not (config.REMOVE_PROFANITY or config.ENFORCE_JSON_OUTPUT):
             return body
 
+        # Walk back to the newest message an earlier turn already filtered
+        signature = self.outlet_signature(config)
+        messages = body.get("messages", [])
+        pending = []
+        for index in range(len(messages) - 1, -1, -1):
+            if self.is_processed(body, index, signature):
+                break
+            pending.append(index)
+
+        matcher = None
+        if pending and config.REMOVE_PROFANITY:
+            matcher = self.word_matcher("PROFANITY_WORDS", config)
+
+        for index in reversed(pending):
+            message = messages[index]
+            message_content = message["content"]
+
+            # Remove explicit words if enabled
+            if matcher is not None:
+                message_content, matches = matcher.scan(message_content)
+                self.report_matches(body, matches, index)
+
+            # Enforce JSON format if required
+            if config.ENFORCE_JSON_OUTPUT:
+                message_content = self.ensure_json_format(message_content)
+
+            message["content"] = message_content
+            self.mark_processed(body, index, signature)
+
+        return body
+
+    def report_matches(
+        self,
+        body: Optional[Dict],
+        matches: List[Dict],
+        message: int = 0,
+        part: Optional[int] = None,
+    ):
+        """
+        Counts matches per rule and attaches them to the body metadata.
+
+        The body gets metadata["moderation"] with a "matches" list (rule, message
+        index, content part index for part lists, start and end) and per-rule
+        "counts", so no second scan is needed.
+
+        Args:
+            body (Optional[Dict]): The payload to annotate, None to only count.
+            matches (List[Dict]): Matches reported by WordMatcher.scan.
+            message (int): Index of the scanned message.
+            part (Optional[int]): Index of the scanned text part, None for string content.
+        """
+        if not matches:
+            return
+        counts = {}
+        for match in matches:
+            counts[match["rule"]] = counts.get(match["rule"], 0) + 1
+        with self._lock:
+            self.rule_counts.update(counts)
+
+        if body is None or not self.config.REPORT_MATCHES:
+            return
+        metadata = body.setdefault("metadata", {})
+        if not isinstance(metadata, dict):
+            return
+        moderation = metadata.setdefault("moderation", {"matches": [], "counts": {}})
+        # Scan results are fresh dicts owned by the caller, so tag them in place
+        for match in matches:
+            match["message"] = message
+            if part is not None:
+                match["part"] = part
+        moderation["matches"].extend(matches)
+        for rule, count in counts.items():
+            moderation["counts"][rule] = moderation["counts"].get(rule, 0) + count
+
+    def match_stats(self) -> Dict[str, int]:
+        """
+        Returns how often each rule matched since the filter was loaded.
+
+        Returns:
+            Dict[str, int]: Match count per rule id, most frequent first.
+        """
+        with self._lock:
+            return dict(self.rule_counts.most_common())
+
+    def outlet_signature(self, config: Optional["Filter.Config"] = None) -> str:
+        """
+        Describes the outlet settings a filtered message depends on.
+
+        Args:
+            config (Optional[Filter.Config]): The user's policy, defaults to the global valves.
+
+        Returns:
+            str: Changes whenever the outlet would filter a message differently.
+        """
+        config = config or self.config
+        words = (
+            self.word_matcher("PROFANITY_WORDS", config).fingerprint
+            if config.REMOVE_PROFANITY
+            else ""
+        )
+        return f"{words}:{config.ENFORCE_JSON_OUTPUT}"
+
+    def processed_key(
+        self, body: Dict, index: int, signature: str
+    ) -> Optional[tuple]:
+        """
+        Identifies a message of a body together with its filtered content.
+
+        Args:
+            body (Dict): The response payload.
+            index (int): Position of the message in body["messages"].
+            signature (str): The current outlet_signature.
+
+        Returns:
+            Optional[tuple]: The content digest and the key remembering it for
+                this chat, whose key is None without a chat id. None when the
+                message cannot be remembered.
+        """
+        message = body["messages"][index]
+        content = message.get("content")
+        if not isinstance(content, str) or self.config.PROCESSED_CACHE_SIZE <= 0:
+            return None
+        digest = hashlib.blake2b(signature.encode("utf-8"), digest_size=16)
+        digest.update(content.encode("utf-8"))
+        digest = digest.hexdigest()
+        chat_id = body.get("chat_id")
+        if not chat_id:
+            return digest, None
+        return digest, f"{chat_id}:{message.get('id') or index}:{digest}"
+
+    def is_processed(self, body: Dict, index: int, signature: str) -> bool:
+        """
+        Tells whether the outlet already produced this message.
+
+        A message counts as filtered when it carries the marker an earlier turn
+        left in its metadata, or when the same chat had the same content at the
+        same message id or position. Content seen in other chats never matches.
+
+        Args:
+            body (Dict): The response payload.
+            index (int): Position of the message in body["messages"].
+            signature (str): The current outlet_signature.
+
+        Returns:
+            bool: True if the message was filtered under the same settings.
+        """
+        key = self.processed_key(body, index, signature)
+        if key is None:
+            return False
+        digest, chat_key = key
+        metadata = body["messages"][index].get("metadata")
+        if isinstance(metadata, dict) and metadata.get("filtered") == digest:
+            return True
+        if chat_key is None:
+            return False
+        with self._lock:
+            if chat_key not in self._processed:
+                return False
+            self._processed.move_to_end(chat_key)
+            return True
+
+    def mark_processed(self, body: Dict, index: int, signature: str):
+        """
+        Marks a filtered message so later turns skip it, evicting the oldest entries.
+
+        Args:
+            body (Dict): The response payload.
+            index (int): Position of the message in body["messages"].
+            signature (str): The current outlet_signature.
+        """
+        key = self.processed_key(body, index, signature)
+        if key is None:
+            return
+        digest, chat_key = key
+        message = body["messages"][index]
+        metadata = message.setdefault("metadata", {})
+        if isinstance(metadata, dict):
+            metadata["filtered"] = digest
+        if chat_key is None:
+            return
+        with self._lock:
+            self._processed[chat_key] = None
+            self._processed.move_to_end(chat_key)
+            while len(self._processed) > self.config.PROCESSED_CACHE_SIZE:
+                self._processed.popitem(last=False)
+
+    def stream(
+        self,
+        event: Dict,
+        __metadata__: Optional[Dict] = None,
+        __user__: Optional[Dict] = None,
+    ) -> Dict:
+        """
+        Filters streamed response deltas as they arrive.
+
+        Each response, keyed by the chat and message ids in the request metadata
+        and the choice index, keeps a ResponseStream that censors with only a
+        possible partial match held back and, when ENFORCE_JSON_OUTPUT is on,
+        encodes the deltas into a {"response": ...} document. The tail is flushed
+        when the choice reports a finish reason. Without a message id nothing is
+        held back: each delta is censored on its own and JSON is left to outlet.
+
+        Args:
+            event (Dict): A streamed chat completion chunk.
+            __metadata__ (Optional[Dict]): Request metadata with "chat_id" and "message_id".
+            __user__ (Optional[Dict]): User metadata.
+
+        Returns:
+            Dict: The chunk with its delta text filtered.
+        """
+        try:
+            config = self.policy(__user__)
+            if not (config.REMOVE_PROFANITY or config.ENFORCE_JSON_OUTPUT):
+                return event
+
+            metadata = __metadata__ or {}
+            message_id = metadata.get("message_id")
+            for choice in event.get("choices", []):
+                delta = choice.get("delta") or {}
+                content = delta.get("content")
+                finished = choice.get("finish_reason") is not None
+                if not isinstance(content, str) and not finished:
+                    continue
+
+                if message_id is None:
+                    if isinstance(content, str) and config.REMOVE_PROFANITY:
+                        matcher = self.word_matcher("PROFANITY_WORDS", config)
+                        delta["content"], matches = matcher.scan(content)
+                        self.report_matches(None, matches)
+                    continue
+
+                key = (metadata.get("chat_id"), message_id, choice.get("index", 0))
+                response_stream = self.response_stream(key, config)
+                text = response_stream.feed(content) if isinstance(content, str) else ""
+                if finished:
+                    text += response_stream.close()
+                    with self._lock:
+                        self._streams.pop(key, None)
+                    if response_stream.censor is not None:
+                        self.report_matches(None, response_stream.censor.matches)
+                if isinstance(content, str) or text:
+                    delta["content"] = text
+                    choice["delta"] = delta
+
+            return event
+
         except Exception as e:
-            return handle_error(e, "outlet", body)
+            return handle_error(e, "stream", event)
+
+    def response_stream(
+        self, key: tuple, config: Optional["Filter.Config"] = None
+    ) -> ResponseStream:
+        """
+        Returns the state of a stream, starting it for a new stream.
 
-    def sanitize_text(self, text: str) -> str:
+        Streams that never report a finish reason are evicted oldest first.
+
+        Args:
+            key (tuple): Chat id, message id and choice index.
+            config (Optional[Filter.Config]): The user's policy, defaults to the global valves.
+
+        Returns:
+            ResponseStream: The stream's transformations.
+        """
+        with self._lock:
+            response_stream = self._streams.get(key)
+            if response_stream is not None:
+                self._streams.move_to_end(key)
+                return response_stream
+
+        config = config or self.config
+        response_stream = ResponseStream(
+            (
+                StreamCensor(self.word_matcher("PROFANITY_WORDS", config))
+                if config.REMOVE_PROFANITY
+                else None
+            ),
+            JSONResponseEncoder() if config.ENFORCE_JSON_OUTPUT else None,
+        )
+        with self._lock:
+            self._streams[key] = response_stream
+            while len(self._streams) > self.MAX_STREAMS:
+                self._streams.popitem(last=False)
+        return response_stream
+
+    def sanitize_text(self, text: str, config: Optional["Filter.Config"] = None) -> str:
         """
         Basic text sanitization function.
 
         Args:
             text (str): The input text.
+            config (Optional[Filter.Config]): The user's policy, defaults to the global valves.
 
         Returns:
             str: Sanitized text.
         """
-        text = text.replace("badword", "***")  # Example censorship
-        return text
+        return self.word_matcher("SANITIZE_WORDS", config).sub(text)
 
-    def remove_profanity(self, text: str) -> str:
+    def remove_profanity(
+        self, text: str, config: Optional["Filter.Config"] = None
+    ) -> str:
         """
         Censors explicit words from responses.
 
         Args:
             text (str): The output text.
+            config (Optional[Filter.Config]): The user's policy, defaults to the global valves.
 
         Returns:
             str: Cleaned text.
         """
-        profanity_list = [
-            "damn",
-            "hell",
-            "curseword1",
-            "curseword2",
-        ]  # Example profanity list
-        for word in profanity_list:
-            text = text.replace(word, "***")
-        return text
+        return self.word_matcher("PROFANITY_WORDS", config).sub(text)
 
     def ensure_json_format(self, text: str) -> str:
         """
@@ -176,7 +1053,202 @@ class Filter:
         Returns:
             str: JSON-compliant string.
         """
-        return json.dumps({"response": text})
+        if text.startswith('{"response": '):
+            # Already wrapped, e.g. history filtered by an earlier turn
+            try:
+                if isinstance(json.loads(text).get("response"), str):
+                    return text
+            except (ValueError, AttributeError):
+                pass
+        encoder = JSONResponseEncoder()
+        return encoder.feed(text) + encoder.close()
+
+    def batch_outlet(
+        self,
+        source: Union[str, os.PathLike, Iterable[Dict]],
+        destination: Union[str, os.PathLike, IO[str]],
+        workers: Optional[int] = None,
+        chunk_size: int = 256,
+        __user__: Optional[Dict] = None,
+    ) -> Dict:
+        """
+        Runs the outlet over many bodies, e.g. exported chat histories.
+
+        The source is streamed in chunks to a process pool and results are written
+        to the destination as JSON lines, in input order, as soon as each chunk is
+        done; at most two chunks per worker are in flight, so memory does not grow
+        with the export. Forked workers inherit the compiled matchers instead of
+        compiling their own. Every body is filtered in full: the history skip of
+        the interactive outlet does not apply to unrelated chats.
+
+        Args:
+            source (Union[str, os.PathLike, Iterable[Dict]]): A JSONL file of bodies, or the bodies themselves.
+            destination (Union[str, os.PathLike, IO[str]]): JSONL file path or writable text stream for the results.
+            workers (Optional[int]): Worker processes, defaults to the CPU count; 0 or 1 runs in this process.
+            chunk_size (int): Bodies sent to a worker at a time.
+            __user__ (Optional[Dict]): User whose policy applies to every body.
+
+        Returns:
+            Dict: Counts of bodies, messages, errors and matches per rule with elapsed time and throughput.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        stats = {"bodies": 0, "messages": 0, "errors": 0}
+        started = time.perf_counter()
+
+        if isinstance(source, (str, os.PathLike)):
+            source_file = open(source, encoding="utf-8")
+            items: Iterable = (line for line in source_file if line.strip())
+        else:
+            source_file = None
+            items = iter(source)
+        if isinstance(destination, (str, os.PathLike)):
+            output = open(destination, "w", encoding="utf-8")
+        else:
+            output = destination
+        chunks = iter(lambda: list(itertools.islice(items, chunk_size)), [])
+
+        rules = Counter()
+
+        def write(result: tuple):
+            lines, messages, errors, counts = result
+            output.write("".join(lines))
+            stats["bodies"] += len(lines)
+            stats["messages"] += messages
+            stats["errors"] += errors
+            rules.update(counts)
+            # Progress roughly every hundred chunks
+            if stats["bodies"] % (chunk_size * 100) < len(lines):
+                elapsed = time.perf_counter() - started
+                logger.info(
+                    f"Batch filtered {stats['bodies']} bodies "
+                    f"({stats['bodies'] / elapsed:.0f}/s)"
+                )
+
+        worker = self.batch_worker()
+        # Workers find their filter by this token, so concurrent batches stay apart
+        token = uuid.uuid4().hex
+        try:
+            if workers <= 1:
+                for chunk in chunks:
+                    write(worker.filter_chunk(chunk, __user__))
+            else:
+                if "fork" in multiprocessing.get_all_start_methods():
+                    context, config = multiprocessing.get_context("fork"), None
+                    _batch_workers[token] = worker
+                else:
+                    context, config = None, self.config.model_dump()
+                with concurrent.futures.ProcessPoolExecutor(
+                    workers,
+                    mp_context=context,
+                    initializer=batch_worker_init,
+                    initargs=(token, config),
+                ) as pool:
+                    pending = deque()
+                    for chunk in chunks:
+                        pending.append(
+                            pool.submit(batch_filter_chunk, token, chunk, __user__)
+                        )
+                        if len(pending) >= workers * 2:
+                            write(pending.popleft().result())
+                    while pending:
+                        write(pending.popleft().result())
+        finally:
+            _batch_workers.pop(token, None)
+            if source_file is not None:
+                source_file.close()
+            if output is not destination:
+                output.close()
+
+        with self._lock:
+            self.rule_counts.update(rules)
+        stats["rules"] = dict(rules.most_common())
+        elapsed = time.perf_counter() - started
+        stats["seconds"] = round(elapsed, 3)
+        stats["bodies_per_second"] = round(stats["bodies"] / elapsed, 1)
+        stats["messages_per_second"] = round(stats["messages"] / elapsed, 1)
+        summary = {key: value for key, value in stats.items() if key != "rules"}
+        logger.info(f"Batch filtering finished: {json.dumps(summary)}")
+        return stats
+
+    def batch_worker(self) -> "Filter":
+        """
+        Copies the filter for batch use, sharing its compiled matchers.
+
+        Returns:
+            Filter: A filter that does not skip remembered messages.
+        """
+        worker = copy.copy(self)
+        worker.config = self.config.model_copy(update={"PROCESSED_CACHE_SIZE": 0})
+        # Rule counts come back with each chunk and are merged by batch_outlet
+        worker.rule_counts = Counter()
+        return worker
+
+    def filter_chunk(
+        self, items: List[Union[str, Dict]], __user__: Optional[Dict] = None
+    ) -> tuple:
+        """
+        Filters a chunk of bodies on a filter returned by batch_worker.
+
+        Args:
+            items (List[Union[str, Dict]]): Bodies, or JSONL lines holding them.
+            __user__ (Optional[Dict]): User whose policy applies.
+
+        Returns:
+            tuple: Result JSON lines, number of messages, number of errors and matches per rule.
+        """
+        config = self.policy(__user__)
+        self.rule_counts.clear()
+        lines = []
+        messages = errors = 0
+        for item in items:
+            try:
+                body = json.loads(item) if isinstance(item, str) else item
+                messages += len(body.get("messages", []))
+                body = self.filter_output(body, config)
+            except Exception as e:
+                body = handle_error(e, "batch_outlet", {"body": str(item)[:200]})
+            if isinstance(body, dict) and body.get("error") is True:
+                errors += 1
+            lines.append(json.dumps(body) + "\n")
+        return lines, messages, errors, dict(self.rule_counts)
+
+
+# Batch Filtering
+# Batch worker filters by batch token; forked worker processes inherit them
+_batch_workers: Dict[str, Filter] = {}
+
+
+def batch_worker_init(token: str, config: Optional[Dict]):
+    """
+    Prepares a batch worker process.
+
+    Args:
+        token (str): Identifies the batch the process works for.
+        config (Optional[Dict]): Valves to build the filter from; None when the
+            filter was inherited by forking.
+    """
+    if config is not None:
+        filter_obj = Filter()
+        filter_obj.config = Filter.Config(**config)
+        _batch_workers[token] = filter_obj.batch_worker()
+
+
+def batch_filter_chunk(
+    token: str, items: List[Union[str, Dict]], __user__: Optional[Dict]
+) -> tuple:
+    """
+    Filters a chunk of bodies in a batch worker process.
+
+    Args:
+        token (str): Identifies the batch the chunk belongs to.
+        items (List[Union[str, Dict]]): Bodies, or JSONL lines holding them.
+        __user__ (Optional[Dict]): User whose policy applies.
+
+    Returns:
+        tuple: Result JSON lines, number of messages, number of errors and matches per rule.
+    """
+    return _batch_workers[token].filter_chunk(items, __user__)
 
 
 # Example Usage